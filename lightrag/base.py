@@ -1,3 +1,4 @@
+import asyncio
 from dataclasses import dataclass, field
 from typing import TypedDict, Union, Literal, Generic, TypeVar
 
@@ -95,6 +96,11 @@ class BaseGraphStorage(StorageNameSpace):
     async def edge_degree(self, src_id: str, tgt_id: str) -> int:
         raise NotImplementedError
 
+    async def edge_degrees_batch(self, edge_pairs: list[tuple[str, str]]) -> list[int]:
+        return await asyncio.gather(
+            *[self.edge_degree(src_id, tgt_id) for src_id, tgt_id in edge_pairs]
+        )
+
     async def get_node(self, node_id: str) -> Union[dict, None]:
         raise NotImplementedError
 
@@ -95,6 +95,7 @@ class LightRAG:
     vector_db_storage_cls_kwargs: dict = field(default_factory=dict)
     graph_storage_cls: Type[BaseGraphStorage] = NetworkXStorage
     enable_llm_cache: bool = True
+    enable_embedding_cache: bool = False
 
     # extension
     addon_params: dict = field(default_factory=dict)
@@ -616,9 +616,7 @@ async def _find_most_related_edges_from_entities(
     all_edges_pack = await asyncio.gather(
         *[knowledge_graph_inst.get_edge(e[0], e[1]) for e in all_edges]
     )
-    all_edges_degree = await asyncio.gather(
-        *[knowledge_graph_inst.edge_degree(e[0], e[1]) for e in all_edges]
-    )
+    all_edges_degree = await knowledge_graph_inst.edge_degrees_batch(all_edges)
     all_edges_data = [
         {"src_tgt": k, "rank": d, **v}
         for k, v, d in zip(all_edges, all_edges_pack, all_edges_degree)
@@ -729,8 +727,8 @@ async def _build_global_query_context(
 
     if not all([n is not None for n in edge_datas]):
         logger.warning("Some edges are missing, maybe the storage is damaged")
-    edge_degree = await asyncio.gather(
-        *[knowledge_graph_inst.edge_degree(r["src_id"], r["tgt_id"]) for r in results]
+    edge_degree = await knowledge_graph_inst.edge_degrees_batch(
+        [(r["src_id"], r["tgt_id"]) for r in results]
     )
     edge_datas = [
         {"src_id": k["src_id"], "tgt_id": k["tgt_id"], "rank": d, **v}
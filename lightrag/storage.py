@@ -2,12 +2,20 @@ import asyncio
 import html
 import os
 from dataclasses import dataclass
-from typing import Any, Union, cast
+from operator import itemgetter
+from typing import Union, cast
 import networkx as nx
 import numpy as np
 from nano_vectordb import NanoVectorDB
 
-from .utils import load_json, logger, write_json
+from .utils import (
+    compute_mdhash_id,
+    load_embedding_cache,
+    load_json,
+    logger,
+    write_embedding_cache,
+    write_json,
+)
 from .base import (
     BaseGraphStorage,
     BaseKVStorage,
@@ -21,13 +29,20 @@ class JsonKVStorage(BaseKVStorage):
         working_dir = self.global_config["working_dir"]
         self._file_name = os.path.join(working_dir, f"kv_store_{self.namespace}.json")
         self._data = load_json(self._file_name) or {}
+        # created lazily so it binds to the loop that actually runs the flush
+        self._write_lock = None
         logger.info(f"Load KV {self.namespace} with {len(self._data)} data")
 
     async def all_keys(self) -> list[str]:
         return list(self._data.keys())
 
     async def index_done_callback(self):
-        write_json(self._data, self._file_name)
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        # one flush at a time, each writing the latest shallow snapshot so
+        # concurrent upserts can't resize the dict mid-dump
+        async with self._write_lock:
+            await asyncio.to_thread(write_json, dict(self._data), self._file_name)
 
     async def get_by_id(self, id):
         return self._data.get(id, None)
@@ -35,17 +50,19 @@ class JsonKVStorage(BaseKVStorage):
     async def get_by_ids(self, ids, fields=None):
         if fields is None:
             return [self._data.get(id, None) for id in ids]
-        return [
-            (
+        # project each distinct id once, repeated ids share the projection
+        projected = {
+            id: (
                 {k: v for k, v in self._data[id].items() if k in fields}
                 if self._data.get(id, None)
                 else None
             )
-            for id in ids
-        ]
+            for id in dict.fromkeys(ids)
+        }
+        return [projected[id] for id in ids]
 
     async def filter_keys(self, data: list[str]) -> set[str]:
-        return set([s for s in data if s not in self._data])
+        return {s for s in data if s not in self._data}
 
     async def upsert(self, data: dict[str, dict]):
         left_data = {k: v for k, v in data.items() if k not in self._data}
@@ -68,9 +85,39 @@ class NanoVectorDBStorage(BaseVectorStorage):
         self._client = NanoVectorDB(
             self.embedding_func.embedding_dim, storage_file=self._client_file_name
         )
+        # created lazily so it binds to the loop that actually runs the calls
+        self._client_lock = None
         self.cosine_better_than_threshold = self.global_config.get(
             "cosine_better_than_threshold", self.cosine_better_than_threshold
         )
+        self._embedding_cache_file_name = os.path.join(
+            self.global_config["working_dir"], f"vdb_{self.namespace}_embeddings.npz"
+        )
+        # one (content hash, vector) per stored record, so a record whose
+        # content is unchanged is not embedded again
+        self._embedding_cache = None
+        self._embedding_cache_dirty = False
+        if self.global_config.get("enable_embedding_cache", False):
+            self._embedding_cache = {}
+            # the cache is only trusted alongside the vector store it was built
+            # with: it is dropped when the vdb file is gone (e.g. deleted to
+            # re-embed with another model) or the embedding dim changed. A model
+            # swap that keeps the dim and the vdb file is not detected
+            if len(self._client):
+                self._embedding_cache = (
+                    load_embedding_cache(
+                        self._embedding_cache_file_name,
+                        self.embedding_func.embedding_dim,
+                    )
+                    or {}
+                )
+
+    async def _run_client(self, func, *args, **kwargs):
+        """Run a blocking client or file call in a thread, one at a time"""
+        if self._client_lock is None:
+            self._client_lock = asyncio.Lock()
+        async with self._client_lock:
+            return await asyncio.to_thread(func, *args, **kwargs)
 
     async def upsert(self, data: dict[str, dict]):
         logger.info(f"Inserting {len(data)} vectors to {self.namespace}")
@@ -84,24 +131,59 @@ class NanoVectorDBStorage(BaseVectorStorage):
             }
             for k, v in data.items()
         ]
-        contents = [v["content"] for v in data.values()]
-        batches = [
-            contents[i : i + self._max_batch_size]
-            for i in range(0, len(contents), self._max_batch_size)
-        ]
-        embeddings_list = await asyncio.gather(
-            *[self.embedding_func(batch) for batch in batches]
+        content_keys = [compute_mdhash_id(v["content"]) for v in data.values()]
+        embeddings = {}
+        if self._embedding_cache is not None:
+            for k, content_key in zip(data.keys(), content_keys):
+                cached = self._embedding_cache.get(k)
+                if cached is not None and cached[0] == content_key:
+                    embeddings[content_key] = cached[1]
+        # only embed contents that are neither cached nor repeated in this batch
+        missing = {
+            content_key: v["content"]
+            for content_key, v in zip(content_keys, data.values())
+            if content_key not in embeddings
+        }
+        missing_keys = list(missing.keys())
+        missing_contents = list(missing.values())
+        logger.info(
+            f"Embedding {len(missing_contents)} of {len(data)} contents for {self.namespace}"
         )
-        embeddings = np.concatenate(embeddings_list)
-        for i, d in enumerate(list_data):
-            d["__vector__"] = embeddings[i]
-        results = self._client.upsert(datas=list_data)
+
+        async def _embed_batch(start: int):
+            batch = missing_contents[start : start + self._max_batch_size]
+            return start, await self.embedding_func(batch)
+
+        # store each batch's vectors as soon as it lands, instead of waiting
+        # for all of them and concatenating
+        for task in asyncio.as_completed(
+            [
+                _embed_batch(start)
+                for start in range(0, len(missing_contents), self._max_batch_size)
+            ]
+        ):
+            start, batch_embeddings = await task
+            for offset, vector in enumerate(batch_embeddings):
+                embeddings[missing_keys[start + offset]] = vector
+        for d, key in zip(list_data, content_keys):
+            d["__vector__"] = embeddings[key]
+        results = await self._run_client(self._client.upsert, datas=list_data)
+        if self._embedding_cache is not None:
+            stale = {
+                k: (key, embeddings[key])
+                for k, key in zip(data.keys(), content_keys)
+                if self._embedding_cache.get(k, (None,))[0] != key
+            }
+            if stale:
+                self._embedding_cache.update(stale)
+                self._embedding_cache_dirty = True
         return results
 
     async def query(self, query: str, top_k=5):
         embedding = await self.embedding_func([query])
         embedding = embedding[0]
-        results = self._client.query(
+        results = await self._run_client(
+            self._client.query,
             query=embedding,
             top_k=top_k,
             better_than_threshold=self.cosine_better_than_threshold,
@@ -112,7 +194,15 @@ class NanoVectorDBStorage(BaseVectorStorage):
         return results
 
     async def index_done_callback(self):
-        self._client.save()
+        await self._run_client(self._client.save)
+        if self._embedding_cache_dirty:
+            self._embedding_cache_dirty = False
+            await self._run_client(
+                write_embedding_cache,
+                dict(self._embedding_cache),
+                self._embedding_cache_file_name,
+                self.embedding_func.embedding_dim,
+            )
 
 
 @dataclass
@@ -128,7 +218,9 @@ class NetworkXStorage(BaseGraphStorage):
         logger.info(
             f"Writing graph with {graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges"
         )
-        nx.write_graphml(graph, file_name)
+        tmp_file_name = f"{file_name}.tmp"
+        nx.write_graphml(graph, tmp_file_name)
+        os.replace(tmp_file_name, file_name)
 
     @staticmethod
     def stable_largest_connected_component(graph: nx.Graph) -> nx.Graph:
@@ -152,28 +244,23 @@ class NetworkXStorage(BaseGraphStorage):
         """
         fixed_graph = nx.DiGraph() if graph.is_directed() else nx.Graph()
 
-        sorted_nodes = graph.nodes(data=True)
-        sorted_nodes = sorted(sorted_nodes, key=lambda x: x[0])
+        sorted_nodes = sorted(graph.nodes(data=True), key=itemgetter(0))
 
         fixed_graph.add_nodes_from(sorted_nodes)
-        edges = list(graph.edges(data=True))
-
-        if not graph.is_directed():
-
-            def _sort_source_target(edge):
-                source, target, edge_data = edge
-                if source > target:
-                    temp = source
-                    source = target
-                    target = temp
-                return source, target, edge_data
 
-            edges = [_sort_source_target(edge) for edge in edges]
+        if graph.is_directed():
+            edges = list(graph.edges(data=True))
+        else:
+            edges = [
+                (
+                    (source, target, edge_data)
+                    if source <= target
+                    else (target, source, edge_data)
+                )
+                for source, target, edge_data in graph.edges(data=True)
+            ]
 
-        def _get_edge_key(source: Any, target: Any) -> str:
-            return f"{source} -> {target}"
-
-        edges = sorted(edges, key=lambda x: _get_edge_key(x[0], x[1]))
+        edges.sort(key=itemgetter(0, 1))
 
         fixed_graph.add_edges_from(edges)
         return fixed_graph
@@ -188,12 +275,23 @@ class NetworkXStorage(BaseGraphStorage):
                 f"Loaded graph from {self._graphml_xml_file} with {preloaded_graph.number_of_nodes()} nodes, {preloaded_graph.number_of_edges()} edges"
             )
         self._graph = preloaded_graph or nx.Graph()
+        # created lazily so it binds to the loop that actually runs the flush
+        self._write_lock = None
         self._node_embed_algorithms = {
             "node2vec": self._node2vec_embed,
         }
 
     async def index_done_callback(self):
-        NetworkXStorage.write_nx_graph(self._graph, self._graphml_xml_file)
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        # one flush at a time, each writing the latest snapshot so concurrent
+        # upserts can't mutate the graph mid-write
+        async with self._write_lock:
+            await asyncio.to_thread(
+                NetworkXStorage.write_nx_graph,
+                self._graph.copy(),
+                self._graphml_xml_file,
+            )
 
     async def has_node(self, node_id: str) -> bool:
         return self._graph.has_node(node_id)
@@ -210,14 +308,26 @@ class NetworkXStorage(BaseGraphStorage):
     async def edge_degree(self, src_id: str, tgt_id: str) -> int:
         return self._graph.degree(src_id) + self._graph.degree(tgt_id)
 
+    async def edge_degrees_batch(self, edge_pairs: list[tuple[str, str]]) -> list[int]:
+        degrees = dict(
+            self._graph.degree(
+                {node_id for edge_pair in edge_pairs for node_id in edge_pair}
+            )
+        )
+        return [
+            degrees.get(src_id, 0) + degrees.get(tgt_id, 0)
+            for src_id, tgt_id in edge_pairs
+        ]
+
     async def get_edge(
         self, source_node_id: str, target_node_id: str
     ) -> Union[dict, None]:
         return self._graph.edges.get((source_node_id, target_node_id))
 
     async def get_node_edges(self, source_node_id: str):
-        if self._graph.has_node(source_node_id):
-            return list(self._graph.edges(source_node_id))
+        neighbors = self._graph.adj.get(source_node_id)
+        if neighbors is not None:
+            return [(source_node_id, target_node_id) for target_node_id in neighbors]
         return None
 
     async def upsert_node(self, node_id: str, node_data: dict[str, str]):
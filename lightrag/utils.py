@@ -4,6 +4,7 @@ import json
 import logging
 import os
 import re
+import zipfile
 from dataclasses import dataclass
 from functools import wraps
 from hashlib import md5
@@ -111,8 +112,58 @@ def load_json(file_name):
 
 
 def write_json(json_obj, file_name):
-    with open(file_name, "w", encoding="utf-8") as f:
+    # write next to the target and swap it in, so a crash or an overlapping
+    # write never leaves a truncated file behind
+    tmp_file_name = f"{file_name}.tmp"
+    with open(tmp_file_name, "w", encoding="utf-8") as f:
         json.dump(json_obj, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_file_name, file_name)
+
+
+def load_embedding_cache(
+    file_name, embedding_dim: int
+) -> Union[dict[str, tuple[str, np.ndarray]], None]:
+    """Load {record id: (content hash, vector)}, or None if the file is missing,
+    unreadable or holds vectors of another dimension"""
+    if not os.path.exists(file_name):
+        return None
+    try:
+        with np.load(file_name) as f:
+            if int(f["embedding_dim"]) != embedding_dim:
+                logger.warning(
+                    f"Ignoring {file_name}, it holds {int(f['embedding_dim'])}-dim vectors"
+                )
+                return None
+            return {
+                id: (content_key, vector)
+                for id, content_key, vector in zip(
+                    f["ids"].tolist(), f["content_keys"].tolist(), f["embeddings"]
+                )
+            }
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+        logger.warning(f"Ignoring unreadable embedding cache {file_name}: {e}")
+        return None
+
+
+def write_embedding_cache(
+    embedding_cache: dict[str, tuple[str, np.ndarray]],
+    file_name,
+    embedding_dim: int,
+):
+    if not embedding_cache:
+        return
+    # write next to the target and swap it in, so a crash never leaves a
+    # truncated cache behind
+    tmp_file_name = f"{file_name}.tmp"
+    with open(tmp_file_name, "wb") as f:
+        np.savez(
+            f,
+            embedding_dim=np.array(embedding_dim),
+            ids=np.array(list(embedding_cache.keys())),
+            content_keys=np.array([v[0] for v in embedding_cache.values()]),
+            embeddings=np.stack([v[1] for v in embedding_cache.values()]),
+        )
+    os.replace(tmp_file_name, file_name)
 
 
 def encode_string_by_tiktoken(content: str, model_name: str = "gpt-4o"):